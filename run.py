@@ -4,8 +4,8 @@ Startup script for the RAG Chatbot Backend.
 This script provides an easy way to run the application.
 """
 
-import uvicorn
 from src.core.config import settings
+from src.core.server import run_server
 
 if __name__ == "__main__":
     print(f"Starting {settings.app_name}...")
@@ -14,10 +14,4 @@ if __name__ == "__main__":
     print(f"Health Check: http://{settings.host}:{settings.port}/health")
     print("\nMake sure you have set your GOOGLE_API_KEY in the .env file!")
     
-    uvicorn.run(
-        "src.main:app",
-        host=settings.host,
-        port=settings.port,
-        reload=settings.debug,
-        access_log=True
-    ) 
\ No newline at end of file
+    run_server()
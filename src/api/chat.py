@@ -2,27 +2,77 @@
 Chat API endpoints for handling user questions and streaming responses.
 """
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+import inspect
+import weakref
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing import AsyncGenerator
 
-from ..models.schemas import ChatRequest, ChatResponse, ErrorResponse
-from ..services.rag_service import RAGService
+from ..core.config import settings
+from ..core.cache import async_ttl_cache
+from ..models.schemas import (
+    ChatRequest,
+    ChatResponse,
+    ConversationHistoryResponse,
+    ConversationMessageResponse,
+    ErrorResponse
+)
+from ..services.rag_service import RAGService, get_rag_service
 from ..services.conversation_manager import conversation_manager
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
-# Initialize RAG service
-rag_service = RAGService()
+# Pre-encoded Server-Sent Events framing
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_SSE_DONE = b"data: [DONE]\n\n"
+
+# StreamingResponse offloads iteration of sync generators to a threadpool,
+# so the streaming pipeline must stay a native async generator end to end
+assert inspect.isasyncgenfunction(RAGService.generate_streaming_response)
+
+# Caps in-flight RAG pipelines per worker; requests over the cap are rejected instead of queued
+_rag_semaphore = asyncio.Semaphore(settings.max_inflight_rag)
+
+
+class _RagSlot:
+    """An acquired in-flight RAG slot, released exactly once however many paths release it."""
+    
+    __slots__ = ("_released", "__weakref__")
+    
+    def __init__(self):
+        self._released = False
+    
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            _rag_semaphore.release()
+
+
+async def _acquire_rag_slot() -> _RagSlot:
+    """Acquire an in-flight RAG slot or fail fast with 503 when the worker is saturated."""
+    try:
+        await asyncio.wait_for(_rag_semaphore.acquire(), timeout=settings.rag_queue_timeout_seconds)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly")
+    return _RagSlot()
 
 
 @router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest) -> ChatResponse:
+async def chat(
+    request: ChatRequest,
+    rag_service: RAGService = Depends(get_rag_service)
+) -> ChatResponse:
     """
     Process a chat message and return a response using RAG.
     
     Args:
         request: Chat request containing the user's message
+        rag_service: RAG service instance
         
     Returns:
         ChatResponse with generated answer and sources
@@ -31,20 +81,30 @@ async def chat(request: ChatRequest) -> ChatResponse:
         if not request.message.strip():
             raise HTTPException(status_code=400, detail="Message cannot be empty")
         
-        response = await rag_service.generate_response(request)
+        slot = await _acquire_rag_slot()
+        try:
+            response = await rag_service.generate_response(request)
+        finally:
+            slot.release()
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing chat request: {str(e)}")
 
 
 @router.post("/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(
+    request: ChatRequest,
+    rag_service: RAGService = Depends(get_rag_service)
+):
     """
     Process a chat message and return a streaming response using RAG.
     
     Args:
         request: Chat request containing the user's message
+        rag_service: RAG service instance
         
     Returns:
         StreamingResponse with real-time generated answer
@@ -53,40 +113,62 @@ async def chat_stream(request: ChatRequest):
         if not request.message.strip():
             raise HTTPException(status_code=400, detail="Message cannot be empty")
         
-        async def generate_response() -> AsyncGenerator[str, None]:
-            """Generate streaming response chunks."""
-            async for chunk in rag_service.generate_streaming_response(request):
-                # Format as Server-Sent Events (SSE)
-                yield f"data: {chunk}\n\n"
-            
-            # Send end signal
-            yield "data: [DONE]\n\n"
+        slot = await _acquire_rag_slot()
+        
+        async def generate_response() -> AsyncGenerator[bytes, None]:
+            """Generate pre-encoded streaming response chunks."""
+            # The slot is held for the lifetime of the stream
+            try:
+                async for chunk in rag_service.generate_streaming_response(request):
+                    # Format as Server-Sent Events (SSE)
+                    payload = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+                    yield _SSE_PREFIX + payload + _SSE_SUFFIX
+                
+                # Send end signal
+                yield _SSE_DONE
+            finally:
+                slot.release()
+        
+        # The generator's finally only runs once iteration has started. If the client
+        # disconnects before the first chunk, the background task (after a completed
+        # response) or the finalizer (when the unstarted generator is collected) frees the slot.
+        # Collection can happen on any thread, so the finalizer hands the release to the loop.
+        body = generate_response()
+        loop = asyncio.get_running_loop()
+        weakref.finalize(body, lambda: loop.call_soon_threadsafe(slot.release)).atexit = False
         
         return StreamingResponse(
-            generate_response(),
-            media_type="text/plain",
+            body,
+            background=BackgroundTask(slot.release),
+            media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
-                "Content-Type": "text/plain; charset=utf-8"
+                "X-Accel-Buffering": "no"
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing streaming chat request: {str(e)}")
 
 
 @router.get("/stats")
-async def get_chat_stats():
+@async_ttl_cache(settings.stats_cache_ttl_seconds)
+async def get_chat_stats(rag_service: RAGService = Depends(get_rag_service)):
     """
     Get statistics about the chat system and knowledge base.
     
+    Args:
+        rag_service: RAG service instance
+    
     Returns:
         Dictionary with system statistics
     """
     try:
         knowledge_base_stats = rag_service.get_collection_stats()
-        conversation_stats = conversation_manager.get_stats()
+        conversation_stats = await conversation_manager.get_stats()
         
         return {
             "status": "healthy",
@@ -110,7 +192,7 @@ async def clear_conversation(session_id: str):
         Success message
     """
     try:
-        success = conversation_manager.clear_conversation(session_id)
+        success = await conversation_manager.clear_conversation(session_id)
         
         if success:
             return {"message": f"Conversation {session_id} cleared successfully", "success": True}
@@ -121,8 +203,8 @@ async def clear_conversation(session_id: str):
         raise HTTPException(status_code=500, detail=f"Error clearing conversation: {str(e)}")
 
 
-@router.get("/conversation/{session_id}")
-async def get_conversation_history(session_id: str, limit: int = 10):
+@router.get("/conversation/{session_id}", response_model=ConversationHistoryResponse)
+async def get_conversation_history(session_id: str, limit: int = 10) -> ConversationHistoryResponse:
     """
     Get conversation history for a specific session.
     
@@ -134,20 +216,21 @@ async def get_conversation_history(session_id: str, limit: int = 10):
         List of conversation messages
     """
     try:
-        messages = conversation_manager.get_recent_messages(session_id, limit)
+        messages = await conversation_manager.get_recent_messages(session_id, limit)
         
-        return {
-            "session_id": session_id,
-            "messages": [
-                {
-                    "role": msg.role,
-                    "content": msg.content,
-                    "timestamp": msg.timestamp.isoformat()
-                }
+        # A declared response model lets FastAPI serialize straight to JSON bytes with Pydantic
+        return ConversationHistoryResponse(
+            session_id=session_id,
+            messages=[
+                ConversationMessageResponse(
+                    role=msg.role,
+                    content=msg.content,
+                    timestamp=datetime.fromtimestamp(msg.ts)
+                )
                 for msg in messages
             ],
-            "message_count": len(messages)
-        }
+            message_count=len(messages)
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving conversation: {str(e)}")
@@ -162,7 +245,7 @@ async def cleanup_expired_sessions():
         Number of sessions cleaned up
     """
     try:
-        cleaned_count = conversation_manager.cleanup_expired_sessions()
+        cleaned_count = await conversation_manager.cleanup_expired_sessions()
         
         return {
             "message": f"Cleaned up {cleaned_count} expired sessions",
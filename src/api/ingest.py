@@ -2,22 +2,33 @@
 Ingestion API endpoints for handling file uploads and knowledge base management.
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
+import asyncio
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends
 from typing import List
 
+from ..core.config import settings
+from ..core.cache import async_ttl_cache
 from ..models.schemas import FileUploadResponse, ErrorResponse
-from ..services.ingestion_service import IngestionService
+from ..services.ingestion_service import IngestionService, get_ingestion_service
 
 router = APIRouter(prefix="/ingest", tags=["ingestion"])
 
-# Initialize ingestion service
-ingestion_service = IngestionService()
+
+def _check_file_size(file: UploadFile) -> None:
+    """Reject uploads whose reported size exceeds the limit before reading them."""
+    if file.size is not None and file.size > settings.max_file_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size is {settings.max_file_size} bytes"
+        )
 
 
 @router.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
     background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    ingestion_service: IngestionService = Depends(get_ingestion_service)
 ) -> FileUploadResponse:
     """
     Upload and process a file to add to the knowledge base.
@@ -25,6 +36,7 @@ async def upload_file(
     Args:
         background_tasks: FastAPI background tasks for processing
         file: The uploaded file (PDF or TXT)
+        ingestion_service: Ingestion service instance
         
     Returns:
         FileUploadResponse with processing results
@@ -33,6 +45,8 @@ async def upload_file(
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
         
+        _check_file_size(file)
+        
         # Process the file
         result = await ingestion_service.process_file(file)
         return result
@@ -46,7 +60,8 @@ async def upload_file(
 @router.post("/upload-multiple")
 async def upload_multiple_files(
     background_tasks: BackgroundTasks,
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File(...),
+    ingestion_service: IngestionService = Depends(get_ingestion_service)
 ) -> List[FileUploadResponse]:
     """
     Upload and process multiple files to add to the knowledge base.
@@ -54,6 +69,7 @@ async def upload_multiple_files(
     Args:
         background_tasks: FastAPI background tasks for processing
         files: List of uploaded files (PDF or TXT)
+        ingestion_service: Ingestion service instance
         
     Returns:
         List of FileUploadResponse with processing results for each file
@@ -62,28 +78,31 @@ async def upload_multiple_files(
         if not files:
             raise HTTPException(status_code=400, detail="No files provided")
         
-        results = []
-        for file in files:
+        # Process files concurrently, bounded so embedding calls don't pile up
+        semaphore = asyncio.Semaphore(settings.max_concurrent_ingests)
+        
+        async def process_one(file: UploadFile) -> FileUploadResponse:
+            if not file.filename:
+                return FileUploadResponse(
+                    message="No filename provided",
+                    filename="unknown",
+                    chunks_processed=0,
+                    success=False
+                )
+            
             try:
-                if file.filename:
-                    result = await ingestion_service.process_file(file)
-                    results.append(result)
-                else:
-                    results.append(FileUploadResponse(
-                        message="No filename provided",
-                        filename="unknown",
-                        chunks_processed=0,
-                        success=False
-                    ))
+                _check_file_size(file)
+                async with semaphore:
+                    return await ingestion_service.process_file(file)
             except Exception as e:
-                results.append(FileUploadResponse(
+                return FileUploadResponse(
                     message=f"Error processing file: {str(e)}",
-                    filename=file.filename or "unknown",
+                    filename=file.filename,
                     chunks_processed=0,
                     success=False
-                ))
+                )
         
-        return results
+        return list(await asyncio.gather(*(process_one(file) for file in files)))
         
     except HTTPException:
         raise
@@ -92,10 +111,13 @@ async def upload_multiple_files(
 
 
 @router.delete("/clear")
-async def clear_knowledge_base():
+async def clear_knowledge_base(ingestion_service: IngestionService = Depends(get_ingestion_service)):
     """
     Clear all documents from the knowledge base.
     
+    Args:
+        ingestion_service: Ingestion service instance
+    
     Returns:
         Success message
     """
@@ -114,10 +136,14 @@ async def clear_knowledge_base():
 
 
 @router.get("/stats")
-async def get_ingestion_stats():
+@async_ttl_cache(settings.stats_cache_ttl_seconds)
+async def get_ingestion_stats(ingestion_service: IngestionService = Depends(get_ingestion_service)):
     """
     Get statistics about the knowledge base.
     
+    Args:
+        ingestion_service: Ingestion service instance
+    
     Returns:
         Dictionary with knowledge base statistics
     """
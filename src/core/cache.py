@@ -0,0 +1,39 @@
+"""
+Small caching helpers shared by the API layer.
+"""
+
+import functools
+import time
+from typing import Any, Awaitable, Callable
+
+
+def async_ttl_cache(ttl_seconds: float) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """
+    Cache the result of a coroutine function for a fixed time.
+    
+    Used for cheap-to-serve monitoring endpoints that are scraped frequently.
+    Arguments are not part of the cache key, so they must not affect the result
+    (e.g. injected service singletons). Exceptions are not cached.
+    
+    Args:
+        ttl_seconds: How long a computed result is reused
+        
+    Returns:
+        Decorator wrapping the coroutine function
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        cached_value: Any = None
+        expires_at = 0.0
+        
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            nonlocal cached_value, expires_at
+            now = time.monotonic()
+            if now >= expires_at:
+                cached_value = await func(*args, **kwargs)
+                expires_at = now + ttl_seconds
+            return cached_value
+        
+        return wrapper
+    
+    return decorator
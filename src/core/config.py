@@ -3,7 +3,7 @@ Core configuration management using Pydantic BaseSettings.
 Loads and validates environment variables with type hints.
 """
 
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 
 
@@ -15,28 +15,53 @@ class Settings(BaseSettings):
     debug: bool = False
     host: str = "0.0.0.0"
     port: int = 8000
+    limit_concurrency: int = 100  # Max concurrent connections per worker before uvicorn returns 503
+    backlog: int = 2048
+    workers: int = 1  # Worker processes; more than 1 requires the Redis session backend, a Chroma server and known-source refresh
+    stats_cache_ttl_seconds: float = 2.0  # How long stats endpoint responses are reused
     
     # Google Gemini API Configuration
     google_api_key: str
     gemini_model: str = "gemini-1.5-flash"
     embedding_model: str = "models/text-embedding-004"
+    embedding_batch_size: int = 100  # Max texts per embedding request
+    embedding_concurrency: int = 4  # Max embedding requests in flight
+    embedding_max_retries: int = 5  # Retries per batch when rate limited (HTTP 429)
     
     # Vector Database Configuration
     chromadb_persist_directory: str = "./chroma_db"
+    chroma_server_host: Optional[str] = None  # Use a Chroma server instead of the embedded store when set
+    chroma_server_port: int = 8000
     collection_name: str = "knowledge_base"
+    embedding_cache_path: Optional[str] = None  # Defaults to <persist directory>_embedding_cache.sqlite3
     
     # RAG Configuration
     chunk_size: int = 1000
     chunk_overlap: int = 200
     max_retrieval_chunks: int = 5
+    context_dedup_threshold: float = 0.95  # Drop retrieved chunks this similar to an already selected one
+    max_context_tokens: int = 6000  # Approximate token budget for retrieved context in the prompt
+    known_sources_refresh_seconds: float = 0.0  # Background reload of source filenames for other workers' uploads (0 disables)
+    query_embedding_cache_size: int = 1024  # Recent query embeddings kept in memory
+    semantic_cache_size: int = 256  # Recent retrieval results reusable by similar queries (0 disables; off with multiple workers)
+    semantic_cache_ttl_seconds: float = 300.0
+    semantic_cache_threshold: float = 0.9  # Min query-to-query cosine similarity for a hit
     temperature: float = 0.1
+    max_inflight_rag: int = 16  # Max concurrent RAG pipelines per worker
+    rag_queue_timeout_seconds: float = 0.5  # Wait for a free RAG slot before returning 503
     
     # Conversation Configuration
     max_history_messages: int = 10
     session_timeout_hours: int = 24
+    max_sessions: int = 10_000
+    
+    # Session Storage Configuration
+    session_backend: str = "memory"  # "memory" or "redis"
+    redis_url: str = "redis://localhost:6379/0"
     
     # System Prompt Configuration
-    system_prompt: str = """Here is a sample systems instruction for your AI chatbot.
+    # Persona and behavior instructions, sent once as the model's system instruction
+    system_instruction: str = """Here is a sample systems instruction for your AI chatbot.
 
 Core Identity
 You are the Akadion Community Guide, a friendly and supportive AI assistant. Your purpose is to welcome graduate students and postdocs to our global community, help them navigate the platform, and encourage them to connect with their peers.
@@ -75,9 +100,10 @@ Example (Bad): "To solve that statistical problem, you should use a t-test..."
 
 If you have said "Hello/Hi/Hey" in the previous message, you should not say it again in the next message.
 
-Fallback Protocol: If you cannot answer a question or a user is experiencing a technical issue you can't solve, direct them to the official "Help Center" or "Contact Support" link.
-
-Previous conversation (if any):
+Fallback Protocol: If you cannot answer a question or a user is experiencing a technical issue you can't solve, direct them to the official "Help Center" or "Contact Support" link."""
+    
+    # Per-request prompt section filled with conversation history and retrieved context
+    rag_context_template: str = """Previous conversation (if any):
 {conversation_history}
 
 Context from uploaded documents:
@@ -89,10 +115,15 @@ Context from uploaded documents:
     # File Upload Configuration
     max_file_size: int = 10 * 1024 * 1024  # 10MB
     allowed_file_types: list = [".pdf", ".txt"]
+    max_concurrent_ingests: int = 4
+    pdf_extraction_workers: int = 4  # Max processes used to parse a large PDF
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    # Settings are read-only after startup
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        frozen=True
+    )
 
 
 # Global settings instance
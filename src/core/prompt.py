@@ -0,0 +1,43 @@
+"""
+Per-request prompt assembly.
+Splits the configured RAG context template around its placeholders once at import,
+so building a prompt per request is a single join instead of template formatting.
+"""
+
+from .config import settings
+
+
+def _split_template(template: str) -> tuple:
+    """Split the template into the literal parts around its placeholders."""
+    pre, found_history, rest = template.partition("{conversation_history}")
+    mid, found_context, post = rest.partition("{context}")
+    
+    if not found_history or not found_context:
+        raise ValueError(
+            "rag_context_template must contain {conversation_history} followed by {context}"
+        )
+    
+    return pre, mid, post
+
+
+_PRE, _MID, _POST = _split_template(settings.rag_context_template)
+
+# Static framing around the filled template, resolved once
+_SYSTEM_PREFIX = "System: " + _PRE
+_HUMAN_PREFIX = _POST + "\n\nHuman: "
+_SUFFIX = "\n\n"
+
+
+def build_prompt(conversation_history: str, context: str, question: str) -> str:
+    """
+    Build the full prompt from conversation history, retrieved context and the question.
+    
+    Args:
+        conversation_history: Formatted previous conversation
+        context: Retrieved document context
+        question: The user's question
+        
+    Returns:
+        Prompt text sent to the model
+    """
+    return "".join((_SYSTEM_PREFIX, conversation_history, _MID, context, _HUMAN_PREFIX, question, _SUFFIX))
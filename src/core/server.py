@@ -0,0 +1,55 @@
+"""
+Uvicorn launcher shared by run.py and ``python -m src.main``.
+"""
+
+from typing import Optional
+
+import uvicorn
+
+from .config import settings
+
+
+def _event_loop() -> str:
+    """Use uvloop where it is installed (it is skipped on Windows), else uvicorn's default."""
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return "auto"
+    return "uvloop"
+
+
+def _worker_count() -> Optional[int]:
+    """Number of worker processes, refusing to fan out over per-process state."""
+    # Reload and multiple workers are mutually exclusive in uvicorn
+    if settings.debug:
+        return None
+    
+    # Sessions and the embedded vector store live in each process, so extra workers
+    # would lose conversation history and miss uploads handled by their siblings
+    # Each worker also needs to pick up the filenames of files uploaded through the others
+    if settings.workers > 1 and (
+        settings.session_backend != "redis"
+        or not settings.chroma_server_host
+        or settings.known_sources_refresh_seconds <= 0
+    ):
+        raise ValueError(
+            "WORKERS > 1 requires SESSION_BACKEND=redis, CHROMA_SERVER_HOST and "
+            "KNOWN_SOURCES_REFRESH_SECONDS > 0 to be set"
+        )
+    return settings.workers
+
+
+def run_server() -> None:
+    """Run the application with uvicorn."""
+    uvicorn.run(
+        "src.main:app",
+        host=settings.host,
+        port=settings.port,
+        reload=settings.debug,
+        workers=_worker_count(),
+        loop=_event_loop(),
+        http="httptools",
+        limit_concurrency=settings.limit_concurrency,
+        backlog=settings.backlog,
+        access_log=True
+    )
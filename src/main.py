@@ -2,14 +2,49 @@
 Main FastAPI application instance with middleware and routing configuration.
 """
 
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
-import uvicorn
 
 from .core.config import settings
+from .core.server import run_server
 from .models.schemas import HealthResponse
 from .api import chat, ingest
+from .services.ingestion_service import get_ingestion_service
+from .services.known_sources import get_known_sources
+from .services.vector_store import get_chroma_collection
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources before serving requests and release them on shutdown."""
+    # Open the shared ChromaDB collection once, before the first request
+    collection = get_chroma_collection()
+    
+    # Load source filenames for query filtering; kept current on ingest and clear
+    known_sources = get_known_sources()
+    await known_sources.load(collection)
+    refresh_task = None
+    if settings.known_sources_refresh_seconds > 0:
+        refresh_task = asyncio.create_task(
+            known_sources.refresh_periodically(collection, settings.known_sources_refresh_seconds)
+        )
+    
+    yield
+    
+    if refresh_task is not None:
+        refresh_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await refresh_task
+    
+    # Only close the ingestion service if a request created it
+    if get_ingestion_service.cache_info().currsize:
+        get_ingestion_service().close()
+
 
 # Create FastAPI application
 app = FastAPI(
@@ -17,18 +52,22 @@ app = FastAPI(
     description="A RAG (Retrieval-Augmented Generation) chatbot backend built with FastAPI and Google Gemini",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.allowed_origins,
+    allow_origins=tuple(settings.allowed_origins),
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
 )
 
+# Compress larger JSON responses; text/event-stream is excluded by default, so SSE is never buffered
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include API routers
 app.include_router(chat.router)
 app.include_router(ingest.router)
@@ -68,11 +107,4 @@ async def global_exception_handler(request, exc):
 
 if __name__ == "__main__":
     # Run the application with uvicorn
-    uvicorn.run(
-        "src.main:app",
-        host=settings.host,
-        port=settings.port,
-        reload=settings.debug,
-        access_log=True
-    )
-
+    run_server()
@@ -0,0 +1,50 @@
+"""
+Internal data structures used by the service layer.
+Plain slotted dataclasses without validation; API request/response models live in schemas.py.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional
+
+# Prompt prefix per message role; unknown roles are labelled as the assistant
+_ROLE_PREFIX = {"user": "Human: ", "assistant": "Assistant: "}
+
+
+@dataclass(slots=True)
+class TextChunk:
+    """A text chunk with metadata."""
+    id: str
+    text: str
+    source: str
+    page_number: Optional[int] = None  # Page number (for PDFs)
+    file_hash: Optional[str] = None  # SHA-256 of the uploaded file
+    embedding: Optional[List[float]] = None
+
+
+@dataclass(slots=True, frozen=True)
+class ConversationMessage:
+    """A single message in a conversation."""
+    role: str  # 'user' or 'assistant'
+    content: str
+    ts: float  # Epoch seconds
+    prefix: str  # Role label used when formatting prompt context
+    
+    @classmethod
+    def create(cls, role: str, content: str, ts: Optional[float] = None) -> "ConversationMessage":
+        """Create a message, resolving its role label once at write time."""
+        return cls(
+            role=role,
+            content=content,
+            ts=time.time() if ts is None else ts,
+            prefix=_ROLE_PREFIX.get(role, "Assistant: ")
+        )
+
+
+@dataclass(slots=True)
+class Conversation:
+    """A conversation session held in memory."""
+    session_id: str
+    messages: Deque[ConversationMessage]  # Bounded by the deque's maxlen
+    created_at: float = field(default_factory=time.time)
+    last_updated: float = field(default_factory=time.time)
@@ -22,6 +22,20 @@ class ChatResponse(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now, description="Response timestamp")
 
 
+class ConversationMessageResponse(BaseModel):
+    """A single message of a conversation history."""
+    role: str = Field(..., description="Message author: user or assistant")
+    content: str = Field(..., description="Message text")
+    timestamp: datetime = Field(..., description="When the message was added")
+
+
+class ConversationHistoryResponse(BaseModel):
+    """Response model for the conversation history endpoint."""
+    session_id: str = Field(..., description="Session identifier")
+    messages: List[ConversationMessageResponse] = Field(default=[], description="Messages, oldest first")
+    message_count: int = Field(..., description="Number of messages returned")
+
+
 class FileUploadResponse(BaseModel):
     """Response model for file upload/ingestion endpoint."""
     message: str = Field(..., description="Status message")
@@ -42,28 +56,4 @@ class ErrorResponse(BaseModel):
     """Response model for error cases."""
     error: str = Field(..., description="Error message")
     detail: Optional[str] = Field(None, description="Detailed error information")
-    timestamp: datetime = Field(default_factory=datetime.now, description="Error timestamp")
-
-
-class TextChunk(BaseModel):
-    """Model representing a text chunk with metadata."""
-    id: str = Field(..., description="Unique identifier for the chunk")
-    text: str = Field(..., description="The text content of the chunk")
-    source: str = Field(..., description="Source file or document")
-    page_number: Optional[int] = Field(None, description="Page number (for PDFs)")
-    embedding: Optional[List[float]] = Field(None, description="Vector embedding of the text")
-
-
-class ConversationMessage(BaseModel):
-    """Model representing a single message in a conversation."""
-    role: str = Field(..., description="Message role: 'user' or 'assistant'")
-    content: str = Field(..., description="Message content")
-    timestamp: datetime = Field(default_factory=datetime.now, description="Message timestamp")
-
-
-class Conversation(BaseModel):
-    """Model representing a conversation session."""
-    session_id: str = Field(..., description="Unique session identifier")
-    messages: List[ConversationMessage] = Field(default=[], description="List of messages in conversation")
-    created_at: datetime = Field(default_factory=datetime.now, description="Conversation creation time")
-    last_updated: datetime = Field(default_factory=datetime.now, description="Last message time") 
\ No newline at end of file
+    timestamp: datetime = Field(default_factory=datetime.now, description="Error timestamp")
\ No newline at end of file
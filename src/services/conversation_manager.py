@@ -1,46 +1,62 @@
 """
-In-memory conversation management service.
-Handles storing and retrieving conversation history for active sessions.
+Conversation management service.
+Handles storing and retrieving conversation history for active sessions
+through a pluggable session backend (in-memory or Redis).
 """
 
-import uuid
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
-from ..models.schemas import Conversation, ConversationMessage
+import asyncio
+import weakref
+from typing import List, Optional
 from ..core.config import settings
+from ..models.internal import ConversationMessage
+from .session_backend import SessionBackend, InMemoryBackend, RedisBackend
 
 
 class ConversationManager:
-    """Manages in-memory conversation storage and retrieval."""
+    """Manages conversation storage and retrieval on top of a session backend."""
     
-    def __init__(self):
-        """Initialize the conversation manager."""
-        # In-memory storage: session_id -> Conversation
-        self._conversations: Dict[str, Conversation] = {}
-        
-        # Configuration
-        self.max_history_messages = getattr(settings, 'max_history_messages', 10)  # Keep last 10 messages
-        self.session_timeout_hours = getattr(settings, 'session_timeout_hours', 24)  # 24 hour timeout
-    
-    def get_conversation(self, session_id: str) -> Conversation:
+    def __init__(self, backend: Optional[SessionBackend] = None):
         """
-        Get or create a conversation for the given session ID.
+        Initialize the conversation manager.
         
         Args:
-            session_id: Unique session identifier
-            
-        Returns:
-            Conversation object for the session
+            backend: Session storage backend (defaults to the one selected by settings.session_backend)
         """
-        if session_id not in self._conversations:
-            self._conversations[session_id] = Conversation(session_id=session_id)
+        # Configuration
+        self.max_history_messages = settings.max_history_messages
+        self.session_timeout_hours = settings.session_timeout_hours
+        self.max_sessions = settings.max_sessions
         
-        # Update last accessed time
-        self._conversations[session_id].last_updated = datetime.now()
+        self._backend = backend if backend is not None else self._create_backend()
         
-        return self._conversations[session_id]
+        # Per-session write locks; entries disappear once no request holds or awaits them
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+    
+    def _get_lock(self, session_id: str) -> asyncio.Lock:
+        """Get the write lock for a session, creating it if needed."""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[session_id] = lock
+        return lock
+    
+    def _create_backend(self) -> SessionBackend:
+        """Create the session backend selected in settings."""
+        if settings.session_backend == "memory":
+            return InMemoryBackend(
+                max_history_messages=self.max_history_messages,
+                session_timeout_hours=self.session_timeout_hours,
+                max_sessions=self.max_sessions
+            )
+        if settings.session_backend == "redis":
+            return RedisBackend(
+                redis_url=settings.redis_url,
+                max_history_messages=self.max_history_messages,
+                session_timeout_hours=self.session_timeout_hours
+            )
+        raise ValueError(f"Unsupported session backend: {settings.session_backend}")
     
-    def add_message(self, session_id: str, role: str, content: str) -> None:
+    async def add_message(self, session_id: str, role: str, content: str) -> None:
         """
         Add a message to the conversation.
         
@@ -49,131 +65,80 @@ class ConversationManager:
             role: Message role ('user' or 'assistant')
             content: Message content
         """
-        conversation = self.get_conversation(session_id)
+        message = ConversationMessage.create(role=role, content=content)
         
-        message = ConversationMessage(
-            role=role,
-            content=content,
-            timestamp=datetime.now()
-        )
-        
-        conversation.messages.append(message)
-        conversation.last_updated = datetime.now()
-        
-        # Trim conversation if it gets too long
-        self._trim_conversation(conversation)
+        async with self._get_lock(session_id):
+            await self._backend.append(session_id, message)
     
-    def get_recent_messages(self, session_id: str, limit: Optional[int] = None) -> List[ConversationMessage]:
+    async def get_recent_messages(self, session_id: str, limit: Optional[int] = None) -> List[ConversationMessage]:
         """
         Get recent messages from a conversation.
         
         Args:
             session_id: Session identifier
             limit: Maximum number of messages to return (defaults to max_history_messages)
-            
+        
         Returns:
             List of recent conversation messages
         """
-        conversation = self.get_conversation(session_id)
-        
         if limit is None:
             limit = self.max_history_messages
         
         # Return the most recent messages (up to the limit)
-        return conversation.messages[-limit:] if conversation.messages else []
+        return await self._backend.get(session_id, limit=limit)
     
-    def get_conversation_context(self, session_id: str, include_current: bool = False) -> str:
+    async def get_conversation_context(self, session_id: str, include_current: bool = False) -> str:
         """
         Get formatted conversation context for including in prompts.
         
         Args:
             session_id: Session identifier
             include_current: Whether to include the very latest message
-            
+        
         Returns:
             Formatted conversation history string
         """
-        messages = self.get_recent_messages(session_id)
-        
-        if not messages:
-            return ""
-        
-        # If we don't want to include current message, remove the last one
-        if not include_current and messages:
-            messages = messages[:-1]
-        
-        if not messages:
-            return ""
-        
-        # Format messages for context
-        context_parts = []
-        for msg in messages:
-            role_label = "Human" if msg.role == "user" else "Assistant"
-            context_parts.append(f"{role_label}: {msg.content}")
-        
-        return "\n\n".join(context_parts)
+        return await self._backend.context(session_id, include_current=include_current)
     
-    def clear_conversation(self, session_id: str) -> bool:
+    async def clear_conversation(self, session_id: str) -> bool:
         """
         Clear a conversation.
         
         Args:
             session_id: Session identifier
-            
+        
         Returns:
             True if conversation was cleared, False if it didn't exist
         """
-        if session_id in self._conversations:
-            del self._conversations[session_id]
-            return True
-        return False
+        async with self._get_lock(session_id):
+            return await self._backend.clear(session_id)
     
-    def _trim_conversation(self, conversation: Conversation) -> None:
-        """
-        Trim conversation to keep only recent messages.
-        
-        Args:
-            conversation: Conversation to trim
-        """
-        if len(conversation.messages) > self.max_history_messages:
-            # Keep only the most recent messages
-            conversation.messages = conversation.messages[-self.max_history_messages:]
-    
-    def cleanup_expired_sessions(self) -> int:
+    async def cleanup_expired_sessions(self) -> int:
         """
         Remove expired conversation sessions.
         
         Returns:
             Number of sessions cleaned up
         """
-        cutoff_time = datetime.now() - timedelta(hours=self.session_timeout_hours)
-        expired_sessions = []
-        
-        for session_id, conversation in self._conversations.items():
-            if conversation.last_updated < cutoff_time:
-                expired_sessions.append(session_id)
-        
-        for session_id in expired_sessions:
-            del self._conversations[session_id]
-        
-        return len(expired_sessions)
+        return await self._backend.expire()
     
-    def get_active_sessions_count(self) -> int:
+    async def get_active_sessions_count(self) -> int:
         """Get the number of active conversation sessions."""
-        return len(self._conversations)
+        stats = await self._backend.stats()
+        return stats["active_sessions"]
     
-    def get_stats(self) -> dict:
+    async def get_stats(self) -> dict:
         """Get conversation manager statistics."""
-        total_sessions = len(self._conversations)
-        total_messages = sum(len(conv.messages) for conv in self._conversations.values())
+        stats = await self._backend.stats()
         
         return {
-            "active_sessions": total_sessions,
-            "total_messages": total_messages,
+            "active_sessions": stats["active_sessions"],
+            "total_messages": stats["total_messages"],
             "max_history_messages": self.max_history_messages,
-            "session_timeout_hours": self.session_timeout_hours
+            "session_timeout_hours": self.session_timeout_hours,
+            "session_backend": settings.session_backend
         }
 
 
 # Global conversation manager instance
-conversation_manager = ConversationManager()
\ No newline at end of file
+conversation_manager = ConversationManager()
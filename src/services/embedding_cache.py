@@ -0,0 +1,92 @@
+"""
+Persistent embedding cache backed by SQLite.
+Maps a content hash of (embedding model, text) to its embedding so unchanged
+chunks are not re-embedded when documents are uploaded again.
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Stay well below SQLite's bound-parameter limit in IN (...) queries
+_LOOKUP_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    """Content-hash keyed store of document embeddings."""
+    
+    def __init__(self, db_path: str):
+        """
+        Initialize the cache and create its table if needed.
+        
+        Args:
+            db_path: Path of the SQLite database file
+        """
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                "hash BLOB PRIMARY KEY, model TEXT NOT NULL, embedding BLOB NOT NULL)"
+            )
+    
+    def _connect(self) -> sqlite3.Connection:
+        # Short-lived connections, so the cache can be used from any executor thread
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        """Compute the cache key of a text for an embedding model."""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+    
+    def get_many_sync(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Look up cached float32 embeddings; missing keys are absent from the result."""
+        found: Dict[bytes, np.ndarray] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        
+        with closing(self._connect()) as conn, conn:
+            for start in range(0, len(unique_keys), _LOOKUP_BATCH_SIZE):
+                batch = unique_keys[start:start + _LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT hash, embedding FROM embedding_cache WHERE hash IN ({placeholders})",
+                    batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        
+        return found
+    
+    def put_many_sync(self, model: str, items: Iterable[Tuple[bytes, np.ndarray]]) -> None:
+        """Store embeddings, keeping existing entries."""
+        rows = [
+            (key, model, np.asarray(embedding, dtype=np.float32).tobytes())
+            for key, embedding in items
+        ]
+        if not rows:
+            return
+        
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO embedding_cache (hash, model, embedding) VALUES (?, ?, ?)",
+                rows
+            )
+    
+    async def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Look up cached embeddings without blocking the event loop."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.get_many_sync, keys)
+    
+    async def put_many(self, model: str, items: Iterable[Tuple[bytes, np.ndarray]]) -> None:
+        """Store embeddings without blocking the event loop."""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.put_many_sync, model, list(items))
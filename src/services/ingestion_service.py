@@ -5,45 +5,88 @@ Handles file processing, text extraction, chunking, vectorization, and storage.
 
 import os
 import uuid
+import bisect
+import hashlib
+import logging
+import sqlite3
+import random
 import asyncio
-from typing import List, Tuple
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import AsyncGenerator, AsyncIterator, List, Optional, Set, Tuple
 from pathlib import Path
 
+import aiofiles
 import fitz  # PyMuPDF
+import numpy as np
 import google.generativeai as genai
-import chromadb
+from chromadb.errors import ChromaError
+from google.api_core import exceptions as google_exceptions
 from fastapi import UploadFile, HTTPException
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from ..core.config import settings
-from ..models.schemas import TextChunk, FileUploadResponse
+from ..models.internal import TextChunk
+from ..models.schemas import FileUploadResponse
+from .embedding_cache import EmbeddingCache
+from .known_sources import get_known_sources
+from .pdf_extraction import extract_page_range
+from .rag_service import get_rag_service
+from .text_splitter import TextSplitter
+from .vector_store import get_chroma_collection, normalize_embeddings
+
+logger = logging.getLogger(__name__)
+
+# Uploads are copied to disk in fixed-size reads to bound memory per request
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+# Below this many pages per worker, process start-up costs more than parallel parsing saves
+MIN_PAGES_PER_PDF_WORKER = 16
+
+# Upper end of the batch size Chroma handles efficiently per add() call
+CHROMA_ADD_BATCH_SIZE = 250
+
+# Records removed per delete() call when clearing the knowledge base
+CHROMA_DELETE_BATCH_SIZE = 5000
 
 
 class IngestionService:
     """Service for handling file ingestion and knowledge base population."""
     
-    def __init__(self):
-        """Initialize the ingestion service with ChromaDB and text splitter."""
+    def __init__(self, collection=None):
+        """
+        Initialize the ingestion service with ChromaDB and text splitter.
+        
+        Args:
+            collection: Knowledge base collection (defaults to the shared one)
+        """
         # Configure Google Generative AI
         genai.configure(api_key=settings.google_api_key)
         
-        # Initialize ChromaDB client
-        self.chroma_client = chromadb.PersistentClient(
-            path=settings.chromadb_persist_directory
-        )
+        # Shared knowledge base collection
+        self.collection = collection if collection is not None else get_chroma_collection()
         
-        # Get or create collection
-        self.collection = self.chroma_client.get_or_create_collection(
-            name=settings.collection_name,
-            metadata={"hnsw:space": "cosine"}
+        # Content-hash cache so unchanged chunks are not re-embedded. It sits beside the
+        # Chroma directory rather than inside it, so it never mixes with Chroma's files
+        cache_path = settings.embedding_cache_path or (
+            os.path.normpath(settings.chromadb_persist_directory) + "_embedding_cache.sqlite3"
         )
+        self.embedding_cache = EmbeddingCache(cache_path)
+        
+        # Content hashes of files being ingested right now, so a concurrent
+        # upload of the same file isn't ingested twice
+        self._ingests_in_flight: Set[str] = set()
+        
+        # Bounds concurrent embedding requests across all ingestions
+        self._embedding_semaphore = asyncio.Semaphore(settings.embedding_concurrency)
+        
+        # Process pool for parsing large PDFs, started lazily
+        self._pdf_pool: Optional[ProcessPoolExecutor] = None
         
         # Initialize text splitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        self.text_splitter = TextSplitter(
             chunk_size=settings.chunk_size,
-            chunk_overlap=settings.chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
+            chunk_overlap=settings.chunk_overlap
         )
     
     async def process_file(self, file: UploadFile) -> FileUploadResponse:
@@ -60,18 +103,40 @@ class IngestionService:
             # Validate file
             self._validate_file(file)
             
-            # Save file temporarily
-            temp_file_path = await self._save_temp_file(file)
+            file_extension = Path(file.filename).suffix.lower()
+            digest = hashlib.sha256()
+            temp_file_path = None
             
             try:
-                # Extract text from file
-                text_content = await self._extract_text(temp_file_path, file.filename)
+                if file_extension == ".txt":
+                    # Plain text is chunked from memory anyway, so skip the temp file
+                    text = await self._read_text_upload(file, digest)
+                    pages = self._text_pages(text)
+                elif file_extension == ".pdf":
+                    # Save file temporarily
+                    temp_file_path = await self._save_temp_file(file, digest)
+                    pages = self._extract_pdf_pages(temp_file_path)
+                else:
+                    raise ValueError(f"Unsupported file type: {file_extension}")
                 
-                # Chunk the text
-                text_chunks = self._chunk_text(text_content, file.filename)
+                # Identical files were already chunked and embedded, or are being so now
+                file_hash = digest.hexdigest()
+                if file_hash in self._ingests_in_flight:
+                    return self._already_ingested_response(file.filename)
                 
-                # Generate embeddings and store in ChromaDB
-                chunks_processed = await self._store_chunks(text_chunks)
+                # Claim the hash before the first await, so the check above stays race-free
+                self._ingests_in_flight.add(file_hash)
+                try:
+                    if await self._is_already_ingested(file_hash):
+                        return self._already_ingested_response(file.filename)
+                    
+                    # Extract, chunk, embed and store the file
+                    chunks_processed = await self._ingest_file(pages, file.filename, file_hash)
+                finally:
+                    self._ingests_in_flight.discard(file_hash)
+                
+                get_known_sources().add(file.filename)
+                get_rag_service().clear_retrieval_cache()
                 
                 return FileUploadResponse(
                     message="File processed successfully",
@@ -82,15 +147,27 @@ class IngestionService:
                 
             finally:
                 # Clean up temporary file
-                if os.path.exists(temp_file_path):
+                if temp_file_path is not None and os.path.exists(temp_file_path):
                     os.unlink(temp_file_path)
                     
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
     
+    @staticmethod
+    def _already_ingested_response(filename: str) -> FileUploadResponse:
+        """Response for an upload whose content is already in the knowledge base."""
+        return FileUploadResponse(
+            message="File already in knowledge base",
+            filename=filename,
+            chunks_processed=0,
+            success=True
+        )
+    
     def _validate_file(self, file: UploadFile) -> None:
         """Validate uploaded file size and type."""
-        if file.size > settings.max_file_size:
+        if file.size is not None and file.size > settings.max_file_size:
             raise HTTPException(
                 status_code=413, 
                 detail=f"File too large. Maximum size is {settings.max_file_size} bytes"
@@ -103,131 +180,344 @@ class IngestionService:
                 detail=f"File type not supported. Allowed types: {settings.allowed_file_types}"
             )
     
-    async def _save_temp_file(self, file: UploadFile) -> str:
+    async def _read_upload(self, file: UploadFile, digest) -> AsyncGenerator[bytes, None]:
+        """Read an upload in fixed-size chunks, enforcing the size limit and hashing its content."""
+        bytes_read = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            bytes_read += len(chunk)
+            # Enforce the limit while streaming in case the upload size was unknown
+            if bytes_read > settings.max_file_size:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File too large. Maximum size is {settings.max_file_size} bytes"
+                )
+            digest.update(chunk)
+            yield chunk
+    
+    async def _save_temp_file(self, file: UploadFile, digest) -> str:
         """Save uploaded file to temporary location."""
         temp_dir = "temp_uploads"
         os.makedirs(temp_dir, exist_ok=True)
         
         temp_file_path = os.path.join(temp_dir, f"{uuid.uuid4()}_{file.filename}")
         
-        with open(temp_file_path, "wb") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
+        try:
+            async with aiofiles.open(temp_file_path, "wb") as temp_file:
+                async for chunk in self._read_upload(file, digest):
+                    await temp_file.write(chunk)
+        except Exception:
+            if os.path.exists(temp_file_path):
+                os.unlink(temp_file_path)
+            raise
         
         return temp_file_path
     
-    async def _extract_text(self, file_path: str, filename: str) -> str:
-        """Extract text from PDF or text files."""
-        file_extension = Path(filename).suffix.lower()
-        
-        if file_extension == ".pdf":
-            return await self._extract_pdf_text(file_path)
-        elif file_extension == ".txt":
-            return await self._extract_txt_text(file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
+    async def _read_text_upload(self, file: UploadFile, digest) -> str:
+        """Read a plain text upload into memory."""
+        content = b"".join([chunk async for chunk in self._read_upload(file, digest)])
+        # Match the newline translation of reading the file in text mode
+        return content.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
     
-    async def _extract_pdf_text(self, file_path: str) -> str:
-        """Extract text from PDF using PyMuPDF."""
-        def extract_text_sync():
-            text_content = ""
-            with fitz.open(file_path) as doc:
-                for page in doc:
-                    text_content += page.get_text()
-            return text_content
+    async def _is_already_ingested(self, file_hash: str) -> bool:
+        """Check whether chunks of a file with this content hash are already stored."""
+        def lookup_sync():
+            return self.collection.get(where={"file_hash": file_hash}, limit=1, include=[])["ids"]
         
-        # Run PDF extraction in thread pool to avoid blocking
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, extract_text_sync)
+        return bool(await loop.run_in_executor(None, lookup_sync))
+    
+    async def _ingest_file(
+        self,
+        pages: AsyncIterator[Tuple[Optional[int], str]],
+        filename: str,
+        file_hash: Optional[str] = None
+    ) -> int:
+        """
+        Extract, chunk, embed and store a file.
+        
+        Pages are chunked as they are extracted, and each full batch of chunks is
+        embedded and stored while later pages are still being parsed. If any step
+        fails, the chunks this call stored are removed again, so a half-ingested
+        file is never mistaken for a complete one.
+        
+        Args:
+            pages: (page_number, text) pairs of the file
+            filename: Original filename, used as the chunk source
+            file_hash: SHA-256 of the file, stored with every chunk
+            
+        Returns:
+            Number of chunks stored
+        """
+        store_tasks = []
+        pending: List[TextChunk] = []
+        # Ids handed to store tasks, so a failure only removes this call's chunks
+        scheduled_ids: List[str] = []
+        
+        try:
+            async for chunk in self._chunk_pages(pages, filename, file_hash):
+                pending.append(chunk)
+                if len(pending) >= settings.embedding_batch_size:
+                    scheduled_ids.extend(chunk.id for chunk in pending)
+                    store_tasks.append(asyncio.create_task(self._store_chunks(pending)))
+                    pending = []
+            
+            if pending:
+                scheduled_ids.extend(chunk.id for chunk in pending)
+                store_tasks.append(asyncio.create_task(self._store_chunks(pending)))
+            
+            return sum(await asyncio.gather(*store_tasks))
+        except BaseException:
+            # Let in-flight writes settle (their executor threads can't be cancelled),
+            # then remove whatever part of the file made it into the collection
+            await asyncio.gather(*store_tasks, return_exceptions=True)
+            if scheduled_ids:
+                await self._delete_chunks(scheduled_ids, filename)
+            raise
+    
+    async def _delete_chunks(self, ids: List[str], filename: str) -> None:
+        """Remove the given chunks of a partially ingested file; unknown ids are ignored."""
+        def delete_sync():
+            for start in range(0, len(ids), CHROMA_DELETE_BATCH_SIZE):
+                self.collection.delete(ids=ids[start:start + CHROMA_DELETE_BATCH_SIZE])
+        
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, delete_sync)
+        except (ChromaError, sqlite3.OperationalError):
+            logger.exception("Error removing partially ingested file %s", filename)
+    
+    async def _text_pages(self, text: str) -> AsyncGenerator[Tuple[Optional[int], str], None]:
+        """Present plain text as a single page without a page number."""
+        yield None, text
     
-    async def _extract_txt_text(self, file_path: str) -> str:
-        """Extract text from plain text files."""
-        def read_text_sync():
-            with open(file_path, "r", encoding="utf-8") as f:
-                return f.read()
+    async def _extract_pdf_pages(self, file_path: str) -> AsyncGenerator[Tuple[int, str], None]:
+        """Extract text from PDF using PyMuPDF, splitting large documents across processes."""
+        def page_count_sync():
+            with fitz.open(file_path) as doc:
+                return doc.page_count
         
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, read_text_sync)
+        page_count = await loop.run_in_executor(None, page_count_sync)
+        
+        num_workers = min(
+            settings.pdf_extraction_workers,
+            os.cpu_count() or 1,
+            page_count // MIN_PAGES_PER_PDF_WORKER
+        )
+        
+        if num_workers <= 1:
+            # Small PDF: run extraction in thread pool to avoid blocking
+            range_futures = [loop.run_in_executor(None, extract_page_range, file_path, 0, page_count)]
+            bounds = [0, page_count]
+        else:
+            # PyMuPDF holds the GIL, so parse contiguous page ranges in separate processes
+            bounds = [page_count * i // num_workers for i in range(num_workers + 1)]
+            range_futures = [
+                loop.run_in_executor(self._get_pdf_pool(), extract_page_range, file_path, start, stop)
+                for start, stop in zip(bounds, bounds[1:])
+            ]
+        
+        # Yield ranges in order while later ranges are still being parsed
+        try:
+            for start, future in zip(bounds, range_futures):
+                for offset, page_text in enumerate(await future):
+                    yield start + offset + 1, page_text
+        finally:
+            for future in range_futures:
+                future.cancel()
     
-    def _chunk_text(self, text: str, source_filename: str) -> List[TextChunk]:
-        """Split text into chunks using RecursiveCharacterTextSplitter."""
-        chunks = self.text_splitter.split_text(text)
+    def _get_pdf_pool(self) -> ProcessPoolExecutor:
+        """Get the process pool for PDF extraction, starting it on first use."""
+        if self._pdf_pool is None:
+            # Spawn rather than fork: this process runs executor threads and gRPC channels,
+            # which a forked child would inherit in an inconsistent state
+            self._pdf_pool = ProcessPoolExecutor(
+                max_workers=settings.pdf_extraction_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pdf_pool
+    
+    def close(self) -> None:
+        """Shut down the PDF extraction pool, if it was started."""
+        if self._pdf_pool is not None:
+            self._pdf_pool.shutdown(cancel_futures=True)
+            self._pdf_pool = None
+    
+    async def _chunk_pages(
+        self,
+        pages: AsyncIterator[Tuple[Optional[int], str]],
+        source_filename: str,
+        file_hash: Optional[str] = None
+    ) -> AsyncGenerator[TextChunk, None]:
+        """
+        Split streamed page text into chunks.
+        
+        Pages are buffered only until a few chunks' worth of text is available; the
+        last chunk of each split is carried over so chunks can span page boundaries.
+        Each chunk is tagged with the page it starts on.
+        """
+        flush_size = 4 * settings.chunk_size
+        buffer = ""
+        page_starts: List[int] = []  # Offset in buffer where each page begins
+        page_numbers: List[Optional[int]] = []
+        chunk_index = 0
         
-        text_chunks = []
-        for i, chunk_text in enumerate(chunks):
+        def make_chunk(start: int, chunk_text: str) -> TextChunk:
+            nonlocal chunk_index
+            page_number = page_numbers[bisect.bisect_right(page_starts, start) - 1]
             chunk = TextChunk(
-                id=f"{source_filename}_{i}_{uuid.uuid4().hex[:8]}",
-                text=chunk_text.strip(),
+                id=f"{source_filename}_{chunk_index}_{uuid.uuid4().hex[:8]}",
+                text=chunk_text,
                 source=source_filename,
-                page_number=None  # Could be enhanced to track page numbers for PDFs
+                page_number=page_number,
+                file_hash=file_hash
             )
-            text_chunks.append(chunk)
+            chunk_index += 1
+            return chunk
         
-        return text_chunks
+        async for page_number, page_text in pages:
+            if not page_text:
+                continue
+            page_starts.append(len(buffer))
+            page_numbers.append(page_number)
+            buffer += page_text
+            
+            if len(buffer) < flush_size:
+                continue
+            
+            # Emit all but the last chunk, which may continue on the next page
+            pieces = self.text_splitter.split(buffer)
+            keep_from = pieces[-1][0] if pieces else 0
+            if keep_from <= 0:
+                continue
+            for start, chunk_text in pieces[:-1]:
+                yield make_chunk(start, chunk_text)
+            
+            # Rebase page offsets onto the carried-over text
+            first_kept = bisect.bisect_right(page_starts, keep_from) - 1
+            page_starts = [0] + [offset - keep_from for offset in page_starts[first_kept + 1:]]
+            page_numbers = page_numbers[first_kept:]
+            buffer = buffer[keep_from:]
+        
+        for start, chunk_text in self.text_splitter.split(buffer):
+            yield make_chunk(start, chunk_text)
     
     async def _store_chunks(self, text_chunks: List[TextChunk]) -> int:
         """Generate embeddings and store chunks in ChromaDB."""
         if not text_chunks:
             return 0
         
+        # Prepare ids, documents and metadata for ChromaDB in a single pass
+        ids, texts, metadatas = map(list, zip(*(
+            (
+                chunk.id,
+                chunk.text,
+                {
+                    "source": str(chunk.source),  # Ensure source is always a string
+                    "text_length": len(chunk.text),
+                    # Only add page_number if it's not None
+                    **({"page_number": int(chunk.page_number)} if chunk.page_number is not None else {}),
+                    **({"file_hash": chunk.file_hash} if chunk.file_hash is not None else {})
+                }
+            )
+            for chunk in text_chunks
+        )))
+        
         # Generate embeddings for all chunks
-        texts = [chunk.text for chunk in text_chunks]
         embeddings = await self._generate_embeddings(texts)
         
-        # Prepare data for ChromaDB
-        ids = [chunk.id for chunk in text_chunks]
-        metadatas = []
-        for chunk in text_chunks:
-            metadata = {
-                "source": str(chunk.source),  # Ensure source is always a string
-                "text_length": len(chunk.text)
-            }
-            # Only add page_number if it's not None
-            if chunk.page_number is not None:
-                metadata["page_number"] = int(chunk.page_number)  # Ensure page_number is an integer
-            metadatas.append(metadata)
-        
-        documents = texts
-        
-        # Store in ChromaDB
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            documents=documents
-        )
+        # Store in ChromaDB, one write transaction per sub-batch
+        def add_sync():
+            for start in range(0, len(ids), CHROMA_ADD_BATCH_SIZE):
+                stop = start + CHROMA_ADD_BATCH_SIZE
+                self.collection.add(
+                    ids=ids[start:stop],
+                    embeddings=embeddings[start:stop],
+                    metadatas=metadatas[start:stop],
+                    documents=texts[start:stop]
+                )
+        
+        # Run in thread pool so index writes don't block the event loop
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, add_sync)
         
         return len(text_chunks)
     
-    async def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings using Google Generative AI."""
-        def generate_embeddings_sync():
-            embeddings = []
-            for text in texts:
-                result = genai.embed_content(
-                    model=settings.embedding_model,
-                    content=text,
-                    task_type="RETRIEVAL_DOCUMENT"
-                )
-                embeddings.append(result["embedding"])
-            return embeddings
+    async def _generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings using Google Generative AI, reusing cached ones.
         
-        # Run embedding generation in thread pool
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, generate_embeddings_sync)
+        Returns:
+            L2-normalized float32 array of shape (len(texts), dimension)
+        """
+        model = settings.embedding_model
+        keys = [EmbeddingCache.key(model, text) for text in texts]
+        cached = await self.embedding_cache.get_many(keys)
+        
+        # Embed each distinct uncached text once
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            missing_keys = list(missing)
+            missing_texts = list(missing.values())
+            
+            # One request per batch instead of per chunk; the API caps the batch size
+            batch_size = settings.embedding_batch_size
+            batches = [
+                missing_texts[start:start + batch_size]
+                for start in range(0, len(missing_texts), batch_size)
+            ]
+            
+            # Submit batches concurrently; gather preserves batch order
+            batch_embeddings = await asyncio.gather(*(self._embed_batch(batch) for batch in batches))
+            new_embeddings = np.vstack(batch_embeddings)
+            
+            await self.embedding_cache.put_many(model, zip(missing_keys, new_embeddings))
+            cached.update(zip(missing_keys, new_embeddings))
+        
+        # Cached embeddings are stored as returned by the API, so normalize on the way out
+        return normalize_embeddings(np.vstack([cached[key] for key in keys]))
+    
+    async def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        """Embed one batch of texts, retrying with jittered backoff when rate limited."""
+        def embed_batch_sync():
+            result = genai.embed_content(
+                model=settings.embedding_model,
+                content=batch,
+                task_type="RETRIEVAL_DOCUMENT"
+            )
+            return np.asarray(result["embedding"], dtype=np.float32)
+        
+        async with self._embedding_semaphore:
+            loop = asyncio.get_event_loop()
+            for attempt in range(settings.embedding_max_retries + 1):
+                try:
+                    # Run embedding generation in thread pool
+                    return await loop.run_in_executor(None, embed_batch_sync)
+                except google_exceptions.ResourceExhausted:
+                    if attempt == settings.embedding_max_retries:
+                        raise
+                    # Jitter keeps concurrent batches from retrying in lockstep
+                    await asyncio.sleep(random.uniform(0, 0.5 * 2 ** attempt))
     
     async def clear_knowledge_base(self) -> bool:
         """Clear all documents from the knowledge base."""
         try:
-            # Delete the collection and recreate it
-            self.chroma_client.delete_collection(name=settings.collection_name)
-            self.collection = self.chroma_client.get_or_create_collection(
-                name=settings.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
+            # Delete records rather than the collection, so the handle shared with
+            # the RAG service stays valid
+            def clear_sync():
+                while True:
+                    ids = self.collection.get(include=[], limit=CHROMA_DELETE_BATCH_SIZE)["ids"]
+                    if not ids:
+                        break
+                    self.collection.delete(ids=ids)
+            
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, clear_sync)
+            get_known_sources().clear()
+            get_rag_service().clear_retrieval_cache()
             return True
-        except Exception as e:
-            print(f"Error clearing knowledge base: {e}")
+        except (ChromaError, sqlite3.OperationalError):
+            logger.exception("Error clearing knowledge base")
             return False
     
     def get_knowledge_base_stats(self) -> dict:
@@ -238,5 +528,12 @@ class IngestionService:
                 "total_documents": count,
                 "collection_name": settings.collection_name
             }
-        except Exception as e:
-            return {"error": str(e)} 
\ No newline at end of file
+        except (ChromaError, sqlite3.OperationalError) as e:
+            logger.exception("Error reading knowledge base stats")
+            return {"error": str(e)}
+
+
+@lru_cache(maxsize=1)
+def get_ingestion_service() -> IngestionService:
+    """Get the shared ingestion service, creating it on first use."""
+    return IngestionService()
@@ -0,0 +1,84 @@
+"""
+Registry of source filenames in the knowledge base.
+Lets retrieval restrict the vector search to documents a query names explicitly.
+"""
+
+import asyncio
+import logging
+import sqlite3
+from functools import lru_cache
+from typing import List, Set
+
+from chromadb.errors import ChromaError
+
+logger = logging.getLogger(__name__)
+
+# Metadata records read per get() call while loading sources
+_LOAD_BATCH_SIZE = 5000
+
+
+class KnownSources:
+    """
+    In-memory set of stored source filenames.
+    
+    Loaded once at startup and updated in place on ingest and clear, so matching a
+    query never touches the vector store. With several workers, a background task
+    can reload it periodically to pick up uploads handled by the other processes.
+    """
+    
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._sources: Set[str] = set()
+    
+    @staticmethod
+    def _load_sync(collection) -> Set[str]:
+        sources: Set[str] = set()
+        offset = 0
+        while True:
+            batch = collection.get(include=["metadatas"], limit=_LOAD_BATCH_SIZE, offset=offset)
+            metadatas = batch["metadatas"] or []
+            sources.update(metadata["source"] for metadata in metadatas if metadata and "source" in metadata)
+            if len(batch["ids"]) < _LOAD_BATCH_SIZE:
+                return sources
+            offset += len(batch["ids"])
+    
+    async def load(self, collection) -> None:
+        """Replace the registry with the sources currently stored in the collection."""
+        loop = asyncio.get_event_loop()
+        self._sources = await loop.run_in_executor(None, self._load_sync, collection)
+    
+    async def refresh_periodically(self, collection, interval_seconds: float) -> None:
+        """Reload the registry every interval until cancelled."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.load(collection)
+            except (ChromaError, sqlite3.OperationalError):
+                logger.exception("Error refreshing known sources")
+    
+    def match(self, query: str) -> List[str]:
+        """
+        Find the known sources mentioned in a query.
+        
+        Args:
+            query: User query
+        
+        Returns:
+            Source filenames that appear in the query (case-insensitive)
+        """
+        lowered = query.lower()
+        return [source for source in self._sources if source.lower() in lowered]
+    
+    def add(self, source: str) -> None:
+        """Register a newly ingested source."""
+        self._sources.add(source)
+    
+    def clear(self) -> None:
+        """Forget all sources after the knowledge base is cleared."""
+        self._sources.clear()
+
+
+@lru_cache(maxsize=1)
+def get_known_sources() -> KnownSources:
+    """Get the shared source registry, creating it on first use."""
+    return KnownSources()
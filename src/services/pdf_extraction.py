@@ -0,0 +1,14 @@
+"""
+PDF page extraction run inside worker processes.
+Kept free of application imports so spawned workers start quickly.
+"""
+
+from typing import List
+
+import fitz  # PyMuPDF
+
+
+def extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of a PDF."""
+    with fitz.open(file_path) as doc:
+        return [doc[page_number].get_text() for page_number in range(start, stop)]
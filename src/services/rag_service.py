@@ -4,49 +4,109 @@ Orchestrates the retrieval-augmentation-generation process for question answerin
 """
 
 import asyncio
-from typing import List, AsyncGenerator, Tuple
+import logging
+import sqlite3
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, AsyncGenerator, Sequence, Tuple
 import google.generativeai as genai
-import chromadb
-from langchain.prompts import ChatPromptTemplate
+import numpy as np
+from chromadb.errors import ChromaError
 
 from ..core.config import settings
+from ..core.prompt import build_prompt
 from ..models.schemas import ChatRequest, ChatResponse
 from .conversation_manager import conversation_manager
+from .known_sources import get_known_sources
+from .semantic_cache import SemanticQueryCache
+from .vector_store import get_chroma_collection, normalize_embeddings
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio used to estimate prompt size without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Backoff between retrieval attempts while the vector store's SQLite database is busy
+RETRIEVAL_RETRY_DELAYS = (0.1, 0.2, 0.4)
+
+
+def _is_database_busy(error: Exception) -> bool:
+    """Check whether an error is transient SQLite lock contention (BUSY/LOCKED)."""
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def _select_context_chunks(documents: Sequence[str], embeddings: Sequence[Sequence[float]]) -> List[int]:
+    """
+    Pick which retrieved chunks go into the prompt.
+    
+    Chunks arrive ordered by relevance. A chunk is dropped if it is a near-duplicate
+    of one already selected (common with overlapping chunks), and selection stops once
+    the token budget is reached. The most relevant chunk is always kept.
+    
+    Returns:
+        Indices of the selected chunks, in relevance order
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if vectors.ndim == 2 and len(vectors) == len(documents):
+        vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+    else:
+        vectors = None
+    
+    selected: List[int] = []
+    token_budget = settings.max_context_tokens
+    for index, document in enumerate(documents):
+        if vectors is not None and selected:
+            if float(np.max(vectors[selected] @ vectors[index])) > settings.context_dedup_threshold:
+                continue
+        
+        tokens = len(document) // CHARS_PER_TOKEN
+        if selected and tokens > token_budget:
+            break
+        selected.append(index)
+        token_budget -= tokens
+    
+    return selected
 
 
 class RAGService:
     """Service for handling Retrieval-Augmented Generation."""
     
-    def __init__(self):
-        """Initialize the RAG service with ChromaDB and Gemini models."""
+    def __init__(self, collection=None):
+        """
+        Initialize the RAG service with ChromaDB and Gemini models.
+        
+        Args:
+            collection: Knowledge base collection (defaults to the shared one)
+        """
         # Configure Google Generative AI
         genai.configure(api_key=settings.google_api_key)
         
-        # Initialize ChromaDB client
-        self.chroma_client = chromadb.PersistentClient(
-            path=settings.chromadb_persist_directory
-        )
+        # Shared knowledge base collection
+        self.collection = collection if collection is not None else get_chroma_collection()
         
-        # Get the collection
-        try:
-            self.collection = self.chroma_client.get_collection(
-                name=settings.collection_name
-            )
-        except Exception:
-            # Collection doesn't exist yet, create it
-            self.collection = self.chroma_client.create_collection(
-                name=settings.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
+        # LRU cache of query embeddings: "model\0query" -> embedding
+        self._query_embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
         
-        # Initialize the generative model
-        self.model = genai.GenerativeModel(settings.gemini_model)
+        # Retrieval results of recent queries, matched by embedding similarity. Uploads
+        # only clear the cache of the worker that handled them, so it is off with
+        # several workers rather than serving results that miss other workers' files
+        self._semantic_cache = SemanticQueryCache(
+            max_entries=settings.semantic_cache_size if settings.workers == 1 else 0,
+            ttl_seconds=settings.semantic_cache_ttl_seconds,
+            threshold=settings.semantic_cache_threshold
+        )
         
-        # Create the prompt template using configurable system prompt
-        self.prompt_template = ChatPromptTemplate.from_messages([
-            ("system", settings.system_prompt),
-            ("human", "{question}")
-        ])
+        # Initialize the generative model; the static persona is sent as the system instruction
+        # so only the short history/context section is formatted per request
+        self.model = genai.GenerativeModel(
+            settings.gemini_model,
+            system_instruction=settings.system_instruction
+        )
+        self.generation_config = genai.types.GenerationConfig(
+            temperature=settings.temperature,
+            max_output_tokens=2048,
+        )
     
     async def generate_response(self, request: ChatRequest) -> ChatResponse:
         """
@@ -60,7 +120,7 @@ class RAGService:
         """
         try:
             # Step 1: Add user message to conversation
-            conversation_manager.add_message(request.session_id, "user", request.message)
+            await conversation_manager.add_message(request.session_id, "user", request.message)
             
             # Step 2: Generate query embedding
             query_embedding = await self._generate_query_embedding(request.message)
@@ -80,7 +140,7 @@ class RAGService:
                 )
             
             # Step 5: Add assistant response to conversation
-            conversation_manager.add_message(request.session_id, "assistant", response_text)
+            await conversation_manager.add_message(request.session_id, "assistant", response_text)
             
             return ChatResponse(
                 response=response_text,
@@ -105,7 +165,7 @@ class RAGService:
         """
         try:
             # Step 1: Add user message to conversation
-            conversation_manager.add_message(request.session_id, "user", request.message)
+            await conversation_manager.add_message(request.session_id, "user", request.message)
             
             # Step 2: Generate query embedding
             query_embedding = await self._generate_query_embedding(request.message)
@@ -118,7 +178,7 @@ class RAGService:
             # Step 4: Generate streaming response using LLM
             if not relevant_chunks:
                 response_text = "I don't have any relevant information in my knowledge base to answer your question. Please upload some documents first or ask about something that might be covered in the uploaded documents."
-                conversation_manager.add_message(request.session_id, "assistant", response_text)
+                await conversation_manager.add_message(request.session_id, "assistant", response_text)
                 yield response_text
             else:
                 # Collect streaming chunks to save complete response to conversation
@@ -130,26 +190,39 @@ class RAGService:
                     yield chunk
                 
                 # Step 5: Add complete assistant response to conversation
-                conversation_manager.add_message(request.session_id, "assistant", complete_response)
+                await conversation_manager.add_message(request.session_id, "assistant", complete_response)
                     
         except Exception as e:
             yield f"I apologize, but I encountered an error while processing your question: {str(e)}"
     
-    async def _generate_query_embedding(self, query: str) -> List[float]:
-        """Generate embedding for the user's query."""
+    async def _generate_query_embedding(self, query: str) -> np.ndarray:
+        """Generate embedding for the user's query, reusing recently computed ones."""
+        cache_key = f"{settings.embedding_model}\0{query}"
+        embedding = self._query_embedding_cache.get(cache_key)
+        if embedding is not None:
+            self._query_embedding_cache.move_to_end(cache_key)
+            return embedding
+        
         def generate_embedding_sync():
             result = genai.embed_content(
                 model=settings.embedding_model,
                 content=query,
                 task_type="RETRIEVAL_QUERY"
             )
-            return result["embedding"]
+            return normalize_embeddings(np.asarray(result["embedding"], dtype=np.float32))
         
         # Run embedding generation in thread pool
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, generate_embedding_sync)
+        embedding = await loop.run_in_executor(None, generate_embedding_sync)
+        
+        # The cache is only touched from the event loop thread, so it needs no lock
+        self._query_embedding_cache[cache_key] = embedding
+        if len(self._query_embedding_cache) > settings.query_embedding_cache_size:
+            self._query_embedding_cache.popitem(last=False)
+        
+        return embedding
     
-    async def _retrieve_context(self, query_embedding: List[float], query: str) -> Tuple[List[str], List[str]]:
+    async def _retrieve_context(self, query_embedding: np.ndarray, query: str) -> Tuple[List[str], List[str]]:
         """
         Retrieve relevant context chunks from the vector database.
         
@@ -160,69 +233,89 @@ class RAGService:
         Returns:
             Tuple of (relevant_chunks, sources)
         """
+        # Restrict the search to documents the query names explicitly
+        named_sources = get_known_sources().match(query)
+        where = {"source": {"$in": named_sources}} if named_sources else None
+        
+        # Near-duplicate queries reuse a recent retrieval result; filtered searches bypass it
+        if where is None:
+            cached = self._semantic_cache.lookup(query_embedding)
+            if cached is not None:
+                return cached
+        
         def retrieve_sync():
-            try:
-                # Perform similarity search
-                results = self.collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=settings.max_retrieval_chunks,
-                    include=["documents", "metadatas"]
-                )
-                
-                if not results["documents"] or not results["documents"][0]:
-                    return [], []
-                
-                documents = results["documents"][0]
-                metadatas = results["metadatas"][0] if results["metadatas"] else []
-                
-                # Extract sources
-                sources = []
-                for metadata in metadatas:
-                    if metadata and "source" in metadata:
-                        source = metadata["source"]
-                        if source not in sources:
-                            sources.append(source)
-                
-                return documents, sources
-                
-            except Exception as e:
-                print(f"Error retrieving context: {e}")
+            # Perform similarity search
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=settings.max_retrieval_chunks,
+                where=where,
+                include=["documents", "metadatas", "embeddings"]
+            )
+            
+            if not results["documents"] or not results["documents"][0]:
                 return [], []
+            
+            documents = results["documents"][0]
+            metadatas = results["metadatas"][0] if results["metadatas"] else []
+            embeddings = results["embeddings"][0] if results["embeddings"] is not None else []
+            
+            # Drop near-duplicate chunks and cap the context size
+            selected = _select_context_chunks(documents, embeddings)
+            documents = [documents[i] for i in selected]
+            metadatas = [metadatas[i] for i in selected if i < len(metadatas)]
+            
+            # Extract sources
+            sources = []
+            for metadata in metadatas:
+                if metadata and "source" in metadata:
+                    source = metadata["source"]
+                    if source not in sources:
+                        sources.append(source)
+            
+            return documents, sources
         
-        # Run retrieval in thread pool
+        # Run retrieval in thread pool, retrying while the database is locked by a writer
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, retrieve_sync)
+        for attempt in range(len(RETRIEVAL_RETRY_DELAYS) + 1):
+            try:
+                documents, sources = await loop.run_in_executor(None, retrieve_sync)
+                break
+            except (ChromaError, sqlite3.OperationalError) as e:
+                if attempt < len(RETRIEVAL_RETRY_DELAYS) and _is_database_busy(e):
+                    await asyncio.sleep(RETRIEVAL_RETRY_DELAYS[attempt])
+                    continue
+                logger.exception("Error retrieving context")
+                return [], []
+        
+        # Empty results are not cached so newly ingested documents are picked up
+        if documents and where is None:
+            self._semantic_cache.store(query_embedding, (documents, sources))
+        
+        return documents, sources
     
-    async def _generate_llm_response(self, question: str, context_chunks: List[str], session_id: str) -> str:
-        """Generate response using the LLM with retrieved context and conversation history."""
+    async def _build_prompt(self, question: str, context_chunks: List[str], session_id: str) -> str:
+        """Build the LLM prompt from retrieved context and conversation history."""
         # Combine context chunks
         context = "\n\n".join(context_chunks)
         
         # Get conversation history (excluding the current message)
-        conversation_history = conversation_manager.get_conversation_context(session_id, include_current=False)
+        conversation_history = await conversation_manager.get_conversation_context(session_id, include_current=False)
         
-        # Create the prompt with both context and conversation history
-        prompt = self.prompt_template.format_messages(
-            context=context,
-            conversation_history=conversation_history if conversation_history else "No previous conversation.",
-            question=question
+        # Create the prompt with context, conversation history and the question
+        return build_prompt(
+            conversation_history if conversation_history else "No previous conversation.",
+            context,
+            question
         )
-        
-        # Convert to string format for Gemini
-        prompt_text = ""
-        for message in prompt:
-            if message.type == "system":
-                prompt_text += f"System: {message.content}\n\n"
-            elif message.type == "human":
-                prompt_text += f"Human: {message.content}\n\n"
+    
+    async def _generate_llm_response(self, question: str, context_chunks: List[str], session_id: str) -> str:
+        """Generate response using the LLM with retrieved context and conversation history."""
+        prompt_text = await self._build_prompt(question, context_chunks, session_id)
         
         def generate_sync():
             response = self.model.generate_content(
                 prompt_text,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=settings.temperature,
-                    max_output_tokens=2048,
-                )
+                generation_config=self.generation_config
             )
             return response.text
         
@@ -232,46 +325,23 @@ class RAGService:
     
     async def _generate_streaming_llm_response(self, question: str, context_chunks: List[str], session_id: str) -> AsyncGenerator[str, None]:
         """Generate streaming response using the LLM with retrieved context and conversation history."""
-        # Combine context chunks
-        context = "\n\n".join(context_chunks)
+        prompt_text = await self._build_prompt(question, context_chunks, session_id)
         
-        # Get conversation history (excluding the current message)
-        conversation_history = conversation_manager.get_conversation_context(session_id, include_current=False)
-        
-        # Create the prompt with both context and conversation history
-        prompt = self.prompt_template.format_messages(
-            context=context,
-            conversation_history=conversation_history if conversation_history else "No previous conversation.",
-            question=question
+        # The async client reads each chunk off the network without blocking the event loop
+        response_stream = await self.model.generate_content_async(
+            prompt_text,
+            generation_config=self.generation_config,
+            stream=True
         )
         
-        # Convert to string format for Gemini
-        prompt_text = ""
-        for message in prompt:
-            if message.type == "system":
-                prompt_text += f"System: {message.content}\n\n"
-            elif message.type == "human":
-                prompt_text += f"Human: {message.content}\n\n"
-        
-        def generate_streaming_sync():
-            response = self.model.generate_content(
-                prompt_text,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=settings.temperature,
-                    max_output_tokens=2048,
-                ),
-                stream=True
-            )
-            return response
-        
-        # Run generation in thread pool and yield chunks
-        loop = asyncio.get_event_loop()
-        response_stream = await loop.run_in_executor(None, generate_streaming_sync)
-        
-        for chunk in response_stream:
+        async for chunk in response_stream:
             if chunk.text:
                 yield chunk.text
     
+    def clear_retrieval_cache(self) -> None:
+        """Forget cached retrieval results so the next queries see the current knowledge base."""
+        self._semantic_cache.clear()
+    
     def get_collection_stats(self) -> dict:
         """Get statistics about the vector database collection."""
         try:
@@ -281,5 +351,12 @@ class RAGService:
                 "collection_name": settings.collection_name,
                 "max_retrieval_chunks": settings.max_retrieval_chunks
             }
-        except Exception as e:
-            return {"error": str(e)} 
\ No newline at end of file
+        except (ChromaError, sqlite3.OperationalError) as e:
+            logger.exception("Error reading collection stats")
+            return {"error": str(e)}
+
+
+@lru_cache(maxsize=1)
+def get_rag_service() -> RAGService:
+    """Get the shared RAG service, creating it on first use."""
+    return RAGService()
@@ -0,0 +1,108 @@
+"""
+Semantic cache for retrieval results.
+Reuses the retrieved context of a recent query whose embedding is close enough
+to the new one, skipping the vector database search for near-duplicate questions.
+"""
+
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RetrievalResult = Tuple[List[str], List[str]]
+
+
+class SemanticQueryCache:
+    """
+    Bounded cache of (query embedding -> retrieval result) with cosine-similarity lookup.
+    
+    Embeddings are L2-normalized and kept in one float32 matrix, so a lookup is a
+    single matrix-vector product over at most ``max_entries`` rows. Entries expire
+    after ``ttl_seconds``; when full, the least recently used entry is replaced.
+    """
+    
+    def __init__(self, max_entries: int, ttl_seconds: float, threshold: float):
+        """
+        Initialize an empty cache.
+        
+        Args:
+            max_entries: Maximum number of cached queries
+            ttl_seconds: Lifetime of a cached result
+            threshold: Minimum cosine similarity for a cache hit
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        
+        # Allocated on first insert, once the embedding dimension is known
+        self._embeddings: Optional[np.ndarray] = None
+        self._created_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._results: List[Optional[RetrievalResult]] = [None] * max_entries
+        self._size = 0
+    
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+    
+    def lookup(self, embedding: Sequence[float]) -> Optional[RetrievalResult]:
+        """
+        Find the cached result of the most similar live query.
+        
+        Args:
+            embedding: Embedding of the new query
+        
+        Returns:
+            Cached (documents, sources) or None on a miss
+        """
+        if self._size == 0 or self.max_entries <= 0:
+            return None
+        
+        now = time.monotonic()
+        similarities = self._embeddings[:self._size] @ self._normalize(embedding)
+        similarities[self._created_at[:self._size] < now - self.ttl_seconds] = -np.inf
+        
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        
+        self._last_used[best] = now
+        return self._results[best]
+    
+    def store(self, embedding: Sequence[float], result: RetrievalResult) -> None:
+        """
+        Cache the retrieval result of a query.
+        
+        Args:
+            embedding: Embedding of the query
+            result: Retrieved (documents, sources)
+        """
+        if self.max_entries <= 0:
+            return
+        
+        vector = self._normalize(embedding)
+        if self._embeddings is None or self._embeddings.shape[1] != vector.shape[0]:
+            self._embeddings = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._size = 0
+        
+        now = time.monotonic()
+        if self._size < self.max_entries:
+            slot = self._size
+            self._size += 1
+        else:
+            # Prefer an expired entry, otherwise replace the least recently used one
+            expired = np.flatnonzero(self._created_at < now - self.ttl_seconds)
+            slot = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+        
+        self._embeddings[slot] = vector
+        self._created_at[slot] = now
+        self._last_used[slot] = now
+        self._results[slot] = result
+    
+    def clear(self) -> None:
+        """Drop every cached result, e.g. after the knowledge base changes."""
+        self._created_at[:] = 0
+        self._last_used[:] = 0
+        self._results = [None] * self.max_entries
+        self._size = 0
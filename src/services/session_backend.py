@@ -0,0 +1,267 @@
+"""
+Storage backends for conversation sessions.
+Provides an in-process backend and a Redis backend that shares sessions across workers.
+"""
+
+import json
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Protocol, Tuple
+
+from ..models.internal import Conversation, ConversationMessage
+
+
+def format_messages(messages: Iterable[ConversationMessage]) -> str:
+    """Format messages as a prompt context string."""
+    return "\n\n".join(msg.prefix + msg.content for msg in messages)
+
+
+class SessionBackend(Protocol):
+    """Storage interface for conversation sessions."""
+    
+    async def get(self, session_id: str, limit: Optional[int] = None) -> List[ConversationMessage]:
+        """Return the most recent messages of a session (all if limit is None), oldest first."""
+        ...
+    
+    async def set(self, session_id: str, messages: List[ConversationMessage]) -> None:
+        """Replace the stored messages of a session."""
+        ...
+    
+    async def append(self, session_id: str, message: ConversationMessage) -> None:
+        """Append a message to a session, trimming it to the history limit."""
+        ...
+    
+    async def context(self, session_id: str, include_current: bool = False) -> str:
+        """Return the formatted prompt context of a session."""
+        ...
+    
+    async def expire(self) -> int:
+        """Remove expired sessions and return how many were removed."""
+        ...
+    
+    async def clear(self, session_id: str) -> bool:
+        """Remove a session and return whether it existed."""
+        ...
+    
+    async def stats(self) -> dict:
+        """Return session and message counts."""
+        ...
+
+
+class InMemoryBackend:
+    """Session storage held in the current process."""
+    
+    def __init__(self, max_history_messages: int, session_timeout_hours: int, max_sessions: int):
+        """Initialize the in-memory backend."""
+        # In-memory storage: session_id -> Conversation, ordered from least to most recently updated
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        
+        # Formatted prompt context per session: session_id -> (all messages, all but the latest)
+        self._context_cache: Dict[str, Tuple[str, str]] = {}
+        
+        # Running message count across sessions, so stats don't walk every conversation
+        self._total_messages = 0
+        
+        self.max_history_messages = max_history_messages
+        self.session_timeout_hours = session_timeout_hours
+        self.max_sessions = max_sessions
+    
+    def _touch(self, session_id: str) -> Conversation:
+        """Get or create a conversation and mark it as most recently used."""
+        conversation = self._conversations.get(session_id)
+        if conversation is None:
+            # The bounded deque drops the oldest message on append, keeping history trimmed
+            conversation = Conversation(
+                session_id=session_id,
+                messages=deque(maxlen=self.max_history_messages)
+            )
+            self._conversations[session_id] = conversation
+        
+        # Update last accessed time and mark as most recently used
+        conversation.last_updated = time.time()
+        self._conversations.move_to_end(session_id)
+        
+        # Evict the least recently used sessions beyond the cap
+        while len(self._conversations) > self.max_sessions:
+            self._remove(next(iter(self._conversations)))
+        
+        return conversation
+    
+    def _lookup(self, session_id: str) -> Optional[Conversation]:
+        """Get an existing conversation and mark it as most recently used, without creating one."""
+        conversation = self._conversations.get(session_id)
+        if conversation is not None:
+            conversation.last_updated = time.time()
+            self._conversations.move_to_end(session_id)
+        return conversation
+    
+    def _remove(self, session_id: str) -> None:
+        """Drop a session and its cached context."""
+        conversation = self._conversations.pop(session_id)
+        self._context_cache.pop(session_id, None)
+        self._total_messages -= len(conversation.messages)
+    
+    async def get(self, session_id: str, limit: Optional[int] = None) -> List[ConversationMessage]:
+        # Reads never create sessions, so unknown ids can't evict real conversations
+        conversation = self._lookup(session_id)
+        if conversation is None:
+            return []
+        messages = conversation.messages
+        
+        # Copy only the requested tail of the deque
+        if limit is None or limit >= len(messages):
+            return list(messages)
+        return list(islice(messages, max(0, len(messages) - limit), None))
+    
+    async def set(self, session_id: str, messages: List[ConversationMessage]) -> None:
+        conversation = self._touch(session_id)
+        self._total_messages -= len(conversation.messages)
+        conversation.messages = deque(messages, maxlen=self.max_history_messages)
+        self._total_messages += len(conversation.messages)
+        
+        # Rebuilt on the next read
+        self._context_cache.pop(session_id, None)
+    
+    async def append(self, session_id: str, message: ConversationMessage) -> None:
+        conversation = self._touch(session_id)
+        
+        # A full deque drops its oldest message on append, invalidating the cached prefix
+        trimmed = len(conversation.messages) == conversation.messages.maxlen
+        conversation.messages.append(message)
+        if not trimmed:
+            self._total_messages += 1
+        
+        # Extend the cached context incrementally; once trimming starts the cached
+        # prefix is stale, so drop it and let the next read rebuild it once
+        cached = self._context_cache.pop(session_id, None)
+        if cached is not None and not trimmed:
+            previous = cached[0]
+            formatted = format_messages((message,))
+            current = f"{previous}\n\n{formatted}" if previous else formatted
+            self._context_cache[session_id] = (current, previous)
+    
+    async def context(self, session_id: str, include_current: bool = False) -> str:
+        conversation = self._lookup(session_id)
+        if conversation is None:
+            return ""
+        
+        cached = self._context_cache.get(session_id)
+        if cached is None:
+            stored = list(conversation.messages)
+            cached = (format_messages(stored), format_messages(stored[:-1]))
+            self._context_cache[session_id] = cached
+        current, previous = cached
+        
+        # If we don't want to include current message, use the context without the last one
+        return current if include_current else previous
+    
+    async def expire(self) -> int:
+        cutoff_time = time.time() - self.session_timeout_hours * 3600
+        expired_count = 0
+        
+        # Sessions are kept in last-updated order, so stop at the first live one
+        while self._conversations:
+            session_id, conversation = next(iter(self._conversations.items()))
+            if conversation.last_updated >= cutoff_time:
+                break
+            self._remove(session_id)
+            expired_count += 1
+        
+        return expired_count
+    
+    async def clear(self, session_id: str) -> bool:
+        if session_id in self._conversations:
+            self._remove(session_id)
+            return True
+        return False
+    
+    async def stats(self) -> dict:
+        return {
+            "active_sessions": len(self._conversations),
+            "total_messages": self._total_messages
+        }
+
+
+class RedisBackend:
+    """
+    Session storage in Redis, shared by all workers.
+    
+    Each session is a Redis list of JSON-encoded messages under ``sess:{session_id}``,
+    trimmed server-side and expired natively by Redis.
+    """
+    
+    def __init__(self, redis_url: str, max_history_messages: int, session_timeout_hours: int):
+        """Initialize the Redis backend."""
+        import redis.asyncio as redis
+        
+        self._redis = redis.from_url(redis_url, decode_responses=True)
+        self.max_history_messages = max_history_messages
+        self._ttl_seconds = session_timeout_hours * 3600
+    
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"sess:{session_id}"
+    
+    @staticmethod
+    def _encode(message: ConversationMessage) -> str:
+        return json.dumps({"role": message.role, "content": message.content, "ts": message.ts})
+    
+    @staticmethod
+    def _decode(raw: str) -> ConversationMessage:
+        return ConversationMessage.create(**json.loads(raw))
+    
+    async def get(self, session_id: str, limit: Optional[int] = None) -> List[ConversationMessage]:
+        # Slice server-side so only the requested tail crosses the wire
+        if limit is not None and limit <= 0:
+            return []
+        start = 0 if limit is None else -limit
+        raw_messages = await self._redis.lrange(self._key(session_id), start, -1)
+        return [self._decode(raw) for raw in raw_messages]
+    
+    async def set(self, session_id: str, messages: List[ConversationMessage]) -> None:
+        key = self._key(session_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if messages:
+                pipe.rpush(key, *(self._encode(msg) for msg in messages))
+                pipe.ltrim(key, -self.max_history_messages, -1)
+                pipe.expire(key, self._ttl_seconds)
+            await pipe.execute()
+    
+    async def append(self, session_id: str, message: ConversationMessage) -> None:
+        # Push, trim and refresh the TTL in a single round-trip
+        key = self._key(session_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, self._encode(message))
+            pipe.ltrim(key, -self.max_history_messages, -1)
+            pipe.expire(key, self._ttl_seconds)
+            await pipe.execute()
+    
+    async def context(self, session_id: str, include_current: bool = False) -> str:
+        messages = await self.get(session_id)
+        
+        # If we don't want to include current message, remove the last one
+        if not include_current:
+            messages = messages[:-1]
+        
+        return format_messages(messages)
+    
+    async def expire(self) -> int:
+        # Redis expires session keys on its own
+        return 0
+    
+    async def clear(self, session_id: str) -> bool:
+        return bool(await self._redis.delete(self._key(session_id)))
+    
+    async def stats(self) -> dict:
+        total_sessions = 0
+        total_messages = 0
+        async for key in self._redis.scan_iter(match="sess:*"):
+            total_sessions += 1
+            total_messages += await self._redis.llen(key)
+        
+        return {
+            "active_sessions": total_sessions,
+            "total_messages": total_messages
+        }
@@ -0,0 +1,92 @@
+"""
+Text splitter for chunking documents.
+Finds candidate break points with one regex pass and greedily packs text into
+overlapping windows, preferring paragraph, then line, then word boundaries.
+"""
+
+import bisect
+import re
+from typing import List, Tuple
+
+# Candidate break points, from strongest to weakest
+_SEP_RE = re.compile(r"\n\n|\n| ")
+_SEPARATORS = ("\n\n", "\n", " ")
+
+
+class TextSplitter:
+    """Greedy splitter producing chunks of at most ``chunk_size`` characters."""
+    
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        """
+        Initialize the splitter.
+        
+        Args:
+            chunk_size: Maximum chunk length in characters
+            chunk_overlap: Approximate number of characters shared by consecutive chunks
+        """
+        self.chunk_size = chunk_size
+        self.chunk_overlap = min(chunk_overlap, chunk_size // 2)
+    
+    def split(self, text: str) -> List[Tuple[int, str]]:
+        """
+        Split text into overlapping chunks.
+        
+        Args:
+            text: Text to split
+        
+        Returns:
+            Non-empty, whitespace-stripped chunks with their offsets in the text
+        """
+        # Offsets just past each separator: all of them, and per separator kind
+        breaks: List[int] = []
+        breaks_by_kind = {separator: [] for separator in _SEPARATORS}
+        for match in _SEP_RE.finditer(text):
+            breaks.append(match.end())
+            breaks_by_kind[match.group()].append(match.end())
+        
+        chunks: List[Tuple[int, str]] = []
+        lo = 0
+        while lo < len(text):
+            if len(text) - lo <= self.chunk_size:
+                cut = len(text)
+            else:
+                cut = self._find_cut(lo, breaks, breaks_by_kind)
+            
+            self._emit(chunks, text, lo, cut)
+            if cut >= len(text):
+                break
+            
+            # Start the next chunk at the first break inside the overlap window
+            next_lo = cut
+            index = bisect.bisect_left(breaks, cut - self.chunk_overlap)
+            if index < len(breaks) and lo < breaks[index] < cut:
+                next_lo = breaks[index]
+            lo = next_lo
+        
+        return chunks
+    
+    def _find_cut(self, lo: int, breaks: List[int], breaks_by_kind: dict) -> int:
+        """Pick where the chunk starting at lo ends."""
+        hi = lo + self.chunk_size
+        
+        # Prefer the strongest separator that still fills at least half the chunk
+        for separator in _SEPARATORS:
+            offsets = breaks_by_kind[separator]
+            index = bisect.bisect_right(offsets, hi) - 1
+            if index >= 0 and offsets[index] > lo + self.chunk_size // 2:
+                return offsets[index]
+        
+        # Otherwise take any break, or cut mid-word if there is none
+        index = bisect.bisect_right(breaks, hi) - 1
+        if index >= 0 and breaks[index] > lo:
+            return breaks[index]
+        return hi
+    
+    @staticmethod
+    def _emit(chunks: List[Tuple[int, str]], text: str, lo: int, cut: int) -> None:
+        chunk_text = text[lo:cut]
+        stripped = chunk_text.lstrip()
+        offset = lo + len(chunk_text) - len(stripped)
+        stripped = stripped.rstrip()
+        if stripped:
+            chunks.append((offset, stripped))
@@ -0,0 +1,83 @@
+"""
+ChromaDB client setup shared by the ingestion and RAG services.
+Uses an embedded persistent client by default, or a standalone Chroma server
+when one is configured so index writes run outside the API process.
+"""
+
+import logging
+import os
+import sqlite3
+from contextlib import closing
+from functools import lru_cache
+
+import chromadb
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# HNSW parameters for the knowledge base collection, tuned for bulk ingestion:
+# a moderate construction_ef/M keeps per-vector build cost low, and larger
+# batch/sync thresholds flush the index to disk less often. Embeddings are
+# L2-normalized before they reach Chroma, so inner product ranks like cosine
+# without normalizing vectors during search.
+COLLECTION_METADATA = {
+    "hnsw:space": "ip",
+    "hnsw:construction_ef": 100,
+    "hnsw:M": 16,
+    "hnsw:batch_size": 500,
+    "hnsw:sync_threshold": 10000
+}
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize embeddings along their last axis, in place."""
+    embeddings /= np.linalg.norm(embeddings, axis=-1, keepdims=True) + 1e-12
+    return embeddings
+
+
+def _enable_sqlite_wal(persist_directory: str) -> None:
+    """Switch the embedded store's SQLite database to write-ahead logging."""
+    # journal_mode is stored in the database file, so it applies to every connection
+    # Chroma opens later. Per-connection pragmas such as synchronous are not set here,
+    # because Chroma keeps a connection per thread. WAL cannot corrupt the database on
+    # a crash, and readers no longer block on writers during ingestion.
+    db_path = os.path.join(persist_directory, "chroma.sqlite3")
+    try:
+        with closing(sqlite3.connect(db_path, timeout=30)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.Error:
+        # Chroma still works in rollback-journal mode, only with more write contention
+        logger.warning("Could not enable WAL for %s", db_path, exc_info=True)
+
+
+def create_chroma_client():
+    """Create the ChromaDB client selected in settings."""
+    if settings.chroma_server_host:
+        return chromadb.HttpClient(
+            host=settings.chroma_server_host,
+            port=settings.chroma_server_port
+        )
+    
+    client = chromadb.PersistentClient(path=settings.chromadb_persist_directory)
+    _enable_sqlite_wal(settings.chromadb_persist_directory)
+    return client
+
+
+@lru_cache(maxsize=1)
+def get_chroma_client():
+    """Get the process-wide ChromaDB client, creating it on first use."""
+    return create_chroma_client()
+
+
+@lru_cache(maxsize=1)
+def get_chroma_collection():
+    """Get the shared knowledge base collection, creating it if needed."""
+    # One handle for every service, so the HNSW index is loaded into memory once.
+    # Collections created before the switch to inner product keep cosine space;
+    # with normalized embeddings both rank identically, so they are used as is.
+    return get_chroma_client().get_or_create_collection(
+        name=settings.collection_name,
+        metadata=COLLECTION_METADATA
+    )
@@ -0,0 +1,8 @@
+"""
+Shared pytest configuration.
+"""
+
+import os
+
+# Settings require an API key at import time; tests never call the API
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
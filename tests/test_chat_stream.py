@@ -0,0 +1,60 @@
+"""
+Tests for in-flight RAG slot accounting on the streaming chat endpoint.
+"""
+
+import asyncio
+import gc
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("chromadb")
+
+from src.api import chat
+from src.core.config import settings
+from src.models.schemas import ChatRequest
+
+
+class _FakeRAGService:
+    """Streams a fixed answer without touching the model or vector store."""
+    
+    async def generate_streaming_response(self, request):
+        yield "Hello"
+        yield "world"
+
+
+def _free_slots() -> int:
+    return chat._rag_semaphore._value
+
+
+def test_slot_released_when_client_disconnects_before_first_chunk():
+    async def scenario():
+        response = await chat.chat_stream(ChatRequest(message="hi"), rag_service=_FakeRAGService())
+        assert _free_slots() == settings.max_inflight_rag - 1
+        
+        # The server closes the body iterator without ever starting it
+        await response.body_iterator.aclose()
+        del response
+        gc.collect()
+        
+        # The finalizer schedules the release on the loop
+        await asyncio.sleep(0)
+        assert _free_slots() == settings.max_inflight_rag
+    
+    asyncio.run(scenario())
+    assert _free_slots() == settings.max_inflight_rag
+
+
+def test_slot_released_once_after_complete_stream():
+    async def scenario():
+        response = await chat.chat_stream(ChatRequest(message="hi"), rag_service=_FakeRAGService())
+        chunks = [chunk async for chunk in response.body_iterator]
+        assert chunks[-1] == b"data: [DONE]\n\n"
+        
+        # The background task runs after the body; it must not release a second time
+        await response.background()
+        del response
+        gc.collect()
+    
+    asyncio.run(scenario())
+    assert _free_slots() == settings.max_inflight_rag
@@ -0,0 +1,51 @@
+"""
+Tests for response compression on the chat endpoints.
+"""
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("chromadb")
+pytest.importorskip("fitz")
+
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.services.rag_service import get_rag_service
+
+
+class _FakeRAGService:
+    """Serves large stats and a long streamed answer without a model or vector store."""
+    
+    def get_collection_stats(self) -> dict:
+        return {"total_chunks": 1, "sources": ["document.pdf"] * 200}
+    
+    async def generate_streaming_response(self, request):
+        for _ in range(200):
+            yield "Lorem ipsum dolor sit amet. "
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_rag_service] = _FakeRAGService
+    # Not entered as a context manager, so the lifespan never opens the vector store
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_large_json_response_is_gzipped(client):
+    response = client.get("/chat/stats", headers={"Accept-Encoding": "gzip"})
+    
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.content) > 1024
+
+
+def test_event_stream_is_not_compressed(client):
+    response = client.post("/chat/stream", json={"message": "hi"}, headers={"Accept-Encoding": "gzip"})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "content-encoding" not in response.headers
+    assert len(response.content) > 1024
+    assert response.text.endswith("data: [DONE]\n\n")
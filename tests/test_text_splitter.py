@@ -0,0 +1,113 @@
+"""
+Tests for the regex text splitter and streamed page chunking.
+"""
+
+import asyncio
+import bisect
+import random
+
+import pytest
+
+from src.services.text_splitter import TextSplitter
+
+CHUNK_SIZE = 200
+CHUNK_OVERLAP = 50
+
+
+def _random_text(seed: int, words: int = 3000) -> str:
+    """Words of random length joined by a mix of word, line and paragraph breaks."""
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(words):
+        parts.append("".join(rng.choice("abcdefg") for _ in range(rng.randint(1, 12))))
+        parts.append(rng.choice([" "] * 12 + ["\n", "\n\n", "  ", "\n\n\n"]))
+    return "".join(parts)
+
+
+@pytest.fixture
+def splitter() -> TextSplitter:
+    return TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_chunks_fit_and_match_offsets(splitter, seed):
+    text = _random_text(seed)
+    chunks = splitter.split(text)
+    
+    assert chunks
+    for offset, chunk in chunks:
+        assert 0 < len(chunk) <= CHUNK_SIZE
+        assert chunk == chunk.strip()
+        assert text[offset:offset + len(chunk)] == chunk
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_only_whitespace_left_uncovered(splitter, seed):
+    text = _random_text(seed)
+    covered = [False] * len(text)
+    for offset, chunk in splitter.split(text):
+        covered[offset:offset + len(chunk)] = [True] * len(chunk)
+    
+    assert all(covered[i] or text[i].isspace() for i in range(len(text)))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_overlap_within_limit(splitter, seed):
+    chunks = splitter.split(_random_text(seed))
+    
+    for (prev_offset, prev_chunk), (offset, _) in zip(chunks, chunks[1:]):
+        assert offset > prev_offset
+        assert prev_offset + len(prev_chunk) - offset <= CHUNK_OVERLAP
+
+
+def test_long_unbroken_word_is_cut_at_chunk_size(splitter):
+    text = "x" * (CHUNK_SIZE * 2 + 30)
+    chunks = splitter.split(text)
+    
+    assert [offset for offset, _ in chunks] == [0, CHUNK_SIZE, 2 * CHUNK_SIZE]
+    assert "".join(chunk for _, chunk in chunks) == text
+
+
+def test_empty_and_blank_text(splitter):
+    assert splitter.split("") == []
+    assert splitter.split(" \n\n  ") == []
+
+
+def test_prefers_paragraph_breaks(splitter):
+    first = "a " * 70  # 140 characters, past half the chunk size
+    text = first + "\n\n" + "b " * 100
+    offset, chunk = splitter.split(text)[0]
+    
+    assert offset == 0
+    assert chunk == first.strip()
+
+
+def test_streamed_pages_match_joined_text():
+    pytest.importorskip("chromadb")
+    pytest.importorskip("google.generativeai")
+    from src.core.config import settings
+    from src.services.ingestion_service import IngestionService
+    
+    # Chunking only needs the splitter, not the vector store or model clients
+    service = IngestionService.__new__(IngestionService)
+    service.text_splitter = TextSplitter(settings.chunk_size, settings.chunk_overlap)
+    
+    text = _random_text(7, words=6000)
+    page_size = len(text) // 9
+    pages = [text[start:start + page_size] for start in range(0, len(text), page_size)]
+    page_starts = [i * page_size for i in range(len(pages))]
+    
+    async def page_stream():
+        for page_number, page_text in enumerate(pages, start=1):
+            yield page_number, page_text
+    
+    async def collect():
+        return [chunk async for chunk in service._chunk_pages(page_stream(), "doc.pdf")]
+    
+    streamed = asyncio.run(collect())
+    expected = service.text_splitter.split(text)
+    
+    assert [chunk.text for chunk in streamed] == [chunk for _, chunk in expected]
+    assert [chunk.page_number for chunk in streamed] == [
+        bisect.bisect_right(page_starts, offset) for offset, _ in expected
+    ]